@@ -0,0 +1,85 @@
+# bench_shards.py
+# 합성 코퍼스로 샤드 scatter-gather(BM25) 확장성 측정
+#   python3 bench_shards.py --docs 50000 --shards 1 2 4 --queries 50
+# dense 는 샤드별 Chroma 컬렉션 색인(run.py index --shard i/N)이 필요해 여기서는 sparse 경로만 측정
+import argparse, json, os, random, time
+from src import retrieval
+from src.shards import ShardPool
+
+_WORDS = ["corres", "valid", "invs", "wp", "hoare", "state", "relation", "monad", "fail", "return",
+          "bind", "lift", "obj", "cap", "tcb", "sched", "ready", "queue", "asid", "pd", "pt", "irq",
+          "cte", "mdb", "refs", "ko", "at", "simp", "clarsimp", "wpsimp", "auto", "fastforce"]
+_TYPES = ["lemma", "lemma", "lemma", "lemmas", "theorem"]
+
+def _ident(rng):
+    return "_".join(rng.choice(_WORDS) for _ in range(rng.randint(2, 4)))
+
+def make_corpus(path: str, docs: int, seed: int = 0):
+    rng = random.Random(seed)
+    sessions = [f"l4v/proof/{s}" for s in ("invariant-abstract", "refine", "crefine", "drefine", "access-control")]
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(docs):
+            name = f"{_ident(rng)}_{i}"
+            session = rng.choice(sessions)
+            rec = {
+                "type": rng.choice(_TYPES),
+                "source_file": f"{session}/{rng.choice(_WORDS).capitalize()}_{rng.randint(0, 40)}.thy",
+                "explanation": " ".join(rng.choice(_WORDS) for _ in range(40)),
+                "snippet": f"lemma {name}:\n  \"\\<lbrace>{_ident(rng)}\\<rbrace> {_ident(rng)} \\<lbrace>\\<lambda>_. {_ident(rng)}\\<rbrace>\"\n"
+                           f"  by ({rng.choice(['wpsimp', 'clarsimp', 'simp'])} simp: {_ident(rng)}_def)",
+                "score": 1.0,
+            }
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+def _queries(n: int, seed: int = 1):
+    rng = random.Random(seed)
+    return [f"lemma {_ident(rng)}: \"\\<lbrace>{_ident(rng)}\\<rbrace> {_ident(rng)}\"" for _ in range(n)]
+
+def _time_queries(queries, topk):
+    lat, tops = [], []
+    for q in queries:
+        t = time.time()
+        hits = retrieval.retrieve(q, topk=topk, mode="bm25")
+        lat.append(time.time() - t)
+        tops.append([round(h["score"], 6) for h in hits])  # 동점 순서는 샤드마다 다를 수 있어 점수열로 비교
+    return lat, tops
+
+def main():
+    ap = argparse.ArgumentParser(description="샤드 scatter-gather BM25 벤치마크 (합성 코퍼스)")
+    ap.add_argument("--docs", type=int, default=20000)
+    ap.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--queries", type=int, default=30)
+    ap.add_argument("--topk", type=int, default=10)
+    ap.add_argument("--corpus", default="bench_data/synthetic.jsonl")
+    args = ap.parse_args()
+
+    os.makedirs(os.path.dirname(args.corpus) or ".", exist_ok=True)
+    make_corpus(args.corpus, args.docs)
+    queries = _queries(args.queries)
+    print(f"[bench] corpus={args.corpus} docs={args.docs} queries={len(queries)} topk={args.topk}")
+
+    baseline = None
+    for n in args.shards:
+        t0 = time.time()
+        pool = None
+        if n > 1:
+            pool = ShardPool(n, jsonl_path=args.corpus)
+            retrieval.use_shards(pool)
+        else:
+            retrieval.configure(jsonl_path=args.corpus)
+        retrieval.retrieve(queries[0], topk=args.topk, mode="bm25")  # 로드/전역 통계 워밍업
+        load = time.time() - t0
+        lat, tops = _time_queries(queries, args.topk)
+        if pool is not None:
+            pool.close()
+            retrieval.use_shards(None)
+        if baseline is None:
+            baseline = tops
+        same = sum(a == b for a, b in zip(tops, baseline))
+        lat.sort()
+        print(f"[bench] shards={n} load={load:.2f}s mean={sum(lat)/len(lat)*1000:.1f}ms "
+              f"p50={lat[len(lat)//2]*1000:.1f}ms max={lat[-1]*1000:.1f}ms "
+              f"top{args.topk}_match={same}/{len(queries)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
-import json, re
+import json, re, sys, time, atexit
 from src.indexing import index_jsonl
-from src.retrieval import retrieve
+from src.retrieval import retrieve, use_shards
+from src.shards import ShardPool
+from src.compact import save_compact
+from src.scheduler import parse_ladder, run_closed_loop, stub_generate, stub_verify
 from src.search import search_hybrid
 from src.generator import build_proof_prompt_from_examples, LemmaGenerator
+from src.prefix_cache import order_for_prefix_reuse, PrefixCacheStats
+from src.speculative import speculative_retrieve, SpeculativeStats
 from src.config import ANSWER_TOPK
 
 # --------- 유틸 ---------
@@ -25,13 +30,46 @@ def _hits_to_examples(hits):
         })
     return out
 
-def _maybe_generate(args, query_input, hits):
+def _generate_cases(args, cases):
+    """
+    cases: [(result, query_input, hits)] → result["proof"], result["prompt"] 채움
+    --prompt-layout prefix 이면 레퍼런스를 공유하는 케이스끼리 인접하도록 생성 순서를 재배치
+    """
     if not args.gen:
-        return None
-    examples = _hits_to_examples(hits[:args.k])
-    prompt = build_proof_prompt_from_examples(query_input, examples, max_examples=args.k)
+        return
+    layout = getattr(args, "prompt_layout", "default")
+    jobs = []
+    for res, q, hits in cases:
+        examples = _hits_to_examples(hits[:args.k])
+        prompt = build_proof_prompt_from_examples(q, examples, max_examples=args.k, layout=layout)
+        jobs.append({"result": res, "examples": examples, "prompt": prompt})
+    if layout == "prefix":
+        jobs = order_for_prefix_reuse(jobs)
+
     gen = LemmaGenerator(backend=args.backend, model=args.model, temperature=args.temp)
-    return gen.generate(prompt), prompt
+    stats = PrefixCacheStats()
+    for job in jobs:
+        job["result"]["proof"] = gen.generate(job["prompt"])
+        job["result"]["prompt"] = job["prompt"]
+        stats.add(job["prompt"], gen.last_usage)
+    stats.report()
+
+def _filter_kwargs(args):
+    types = [t.strip() for t in (getattr(args, "types", None) or "").split(",") if t.strip()]
+    return {
+        "path_prefix": getattr(args, "path_prefix", None),
+        "types": types or None,
+        "exclude_file": getattr(args, "exclude_file", None),
+    }
+
+def _maybe_start_shards(args):
+    # --shards N (N>1): 샤드 워커 N개를 띄우고 retrieve()/search_hybrid() 를 scatter-gather 로 전환
+    n = getattr(args, "shards", 1) or 1
+    if n <= 1:
+        return
+    pool = ShardPool(n)
+    use_shards(pool)
+    atexit.register(pool.close)
 
 def _iter_test_inputs(path):
     with open(path, "r", encoding="utf-8") as f:
@@ -62,74 +100,155 @@ def build_explanation_prompt_for_input(lemma_input: str) -> str:
 
     return f"{header}\n\nLEMMA INPUT:\n{lemma_input}"
     
-def _explain_to_query(input_text: str, backend: str, model: str, temp: float) -> str:
+def _explain_to_query(input_text: str, backend: str, model: str, temp: float, timeout: float = None) -> str:
     prompt = build_explanation_prompt_for_input(input_text)
-    gen = LemmaGenerator(backend=backend, model=model, temperature=temp)
+    gen = LemmaGenerator(backend=backend, model=model, temperature=temp, timeout=timeout)
     out = gen.generate(prompt) or ""
     m = re.search(r"```(.*?)```", out, flags=re.S)
     return m.group(1) if m else input_text
 
 # --------- 커맨드 ---------
 def cmd_index(args):
-    index_jsonl(jsonl_path=args.jsonl) if args.jsonl else index_jsonl()
+    shard = None
+    if args.shard:
+        i, n = (int(x) for x in args.shard.split("/"))
+        shard = (i, n)
+    index_jsonl(jsonl_path=args.jsonl, shard=shard) if args.jsonl else index_jsonl(shard=shard)
+
+def _retrieve_case(args, q, stats):
+    topk = max(args.k, args.topk)
+    if not args.speculative:
+        # 비교 기준: 설명 호출 → 검색 직렬 경로도 같은 방식으로 지연 집계
+        t0 = time.time()
+        explanation = _explain_to_query(q, args.backend, args.model, args.temp)
+        hits = retrieve(explanation, topk=topk, mode=args.mode, **_filter_kwargs(args))
+        path, latency = "serial", time.time() - t0
+        stats.add(path, latency)
+        print(f"[retrieval] path={path} latency={latency:.2f}s", file=sys.stderr)
+        return explanation, hits
+    explanation, hits, path, latency = speculative_retrieve(
+        q,
+        explain=lambda text, timeout: _explain_to_query(text, args.backend, args.model, args.temp, timeout),
+        retrieve=retrieve, topk=topk, mode=args.mode, deadline=args.spec_deadline,
+        **_filter_kwargs(args),
+    )
+    stats.add(path, latency)
+    print(f"[speculative] path={path} latency={latency:.2f}s", file=sys.stderr)
+    return explanation, hits
 
 def cmd_retrieval(args):
-    results = []
+    _maybe_start_shards(args)
+    results, cases = [], []
+    stats = SpeculativeStats()
     if args.test_jsonl:
         for idx, (q, gt) in enumerate(_iter_test_inputs(args.test_jsonl), 1):
-            explanation = _explain_to_query(q, args.backend, args.model, args.temp)
-            hits = retrieve(explanation, topk=max(args.k, args.topk), mode=args.mode)
-            proof, prompt = _maybe_generate(args, q, hits)
-            results.append({
-                "case": idx,
-                "input": q,
-                "gt": gt,
-                "proof": proof,
-                "prompt": prompt,
-                "explanation": explanation,
-                "hits": hits[:args.topk],
-            })
+            explanation, hits = _retrieve_case(args, q, stats)
+            res = {"case": idx, "input": q, "gt": gt, "proof": None, "prompt": None,
+                   "explanation": explanation, "hits": hits[:args.topk]}
+            results.append(res)
+            cases.append((res, q, hits))
     else:
-        explanation = _explain_to_query(args.query, args.backend, args.model, args.temp)
-        hits = retrieve(explanation, topk=max(args.k, args.topk), mode=args.mode)
-        proof, prompt = _maybe_generate(args, args.query, hits)
-        results.append({
-            "input": args.query,
-            "proof": proof,
-            "prompt": prompt,
-            "hits": hits[:args.topk],
-        })
+        explanation, hits = _retrieve_case(args, args.query, stats)
+        res = {"input": args.query, "proof": None, "prompt": None, "hits": hits[:args.topk]}
+        results.append(res)
+        cases.append((res, args.query, hits))
+    stats.report()
+    _generate_cases(args, cases)
 
-    if args.out:
+    if args.out and getattr(args, "compact", False):
+        save_compact(results, args.out)
+    elif args.out:
         _save_json(results, args.out)
     else:
         print(json.dumps(results, ensure_ascii=False, indent=2))
 
 def cmd_search(args):
-    results = []
+    _maybe_start_shards(args)
+    results, cases = [], []
     if args.test_jsonl:
         for idx, (q, gt) in enumerate(_iter_test_inputs(args.test_jsonl), 1):
-            hits = search_hybrid(q, final_n=max(args.k, args.final_n))
-            proof, prompt = _maybe_generate(args, q, hits)
-            results.append({
-                "case": idx,
-                "input": q,
-                "gt": gt,
-                "proof": proof,
-                "prompt": prompt,
-                "hits": hits[:args.k],
-            })
+            hits = search_hybrid(q, final_n=max(args.k, args.final_n), **_filter_kwargs(args))
+            res = {"case": idx, "input": q, "gt": gt, "proof": None, "prompt": None, "hits": hits[:args.k]}
+            results.append(res)
+            cases.append((res, q, hits))
     else:
-        hits = search_hybrid(args.query, final_n=max(args.k, args.final_n))
-        proof, prompt = _maybe_generate(args, args.query, hits)
-        results.append({
-            "input": args.query,
-            "proof": proof,
-            "prompt": prompt,
-            "hits": hits[:args.k],
-        })
+        hits = search_hybrid(args.query, final_n=max(args.k, args.final_n), **_filter_kwargs(args))
+        res = {"input": args.query, "proof": None, "prompt": None, "hits": hits[:args.k]}
+        results.append(res)
+        cases.append((res, args.query, hits))
+    _generate_cases(args, cases)
 
-    if args.out:
+    if args.out and getattr(args, "compact", False):
+        save_compact(results, args.out)
+    elif args.out:
         _save_json(results, args.out)
     else:
-        print(json.dumps(results, ensure_ascii=False, indent=2))
\ No newline at end of file
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+
+def _isabelle_verifier(args):
+    # eval.verify_one 으로 .thy 패치 → isabelle build → 복원 (파일을 패치하므로 검증은 직렬)
+    from pathlib import Path
+    from eval import verify_one
+    thy_path = Path(args.thy)
+    thy_orig = thy_path.read_text(encoding="utf-8")
+    root_path = Path(args.root).resolve()
+
+    def verify(case, proof):
+        result, _ = verify_one(case["case"], case["input"], proof, thy_path=thy_path, thy_orig=thy_orig,
+                               root_path=root_path, session=args.session, timeout=args.timeout)
+        detail = {k: result[k] for k in ("lemma", "returncode", "error", "result") if k in result}
+        return result.get("success") is True, detail
+    return verify
+
+def cmd_prove(args):
+    cases = [{"case": idx, "input": q, "gt": gt}
+             for idx, (q, gt) in enumerate(_iter_test_inputs(args.test_jsonl), 1)]
+    ladder = parse_ladder(args.ladder)
+    max_k = max(k for k, _ in ladder)
+    if args.exclude_file is None and args.thy:
+        # 기본값: 검증 대상 theory 파일을 레퍼런스에서 제외 (정답 snippet 누설 방지)
+        # 코퍼스 source_file 은 "l4v/lib/..." 처럼 --root 디렉터리 이름부터 시작
+        from pathlib import Path
+        root = Path(args.root).resolve()
+        try:
+            args.exclude_file = Path(args.thy).resolve().relative_to(root.parent).as_posix()
+            print(f"[INFO] exclude-file: {args.exclude_file}", file=sys.stderr)
+        except ValueError:
+            print(f"[WARN] --thy 가 --root 아래에 없어 기본 exclude-file 을 정할 수 없습니다: {args.thy}", file=sys.stderr)
+
+    def retrieve_fn(q):
+        if args.mode == "hybrid":
+            return search_hybrid(q, final_n=max_k, **_filter_kwargs(args))
+        return retrieve(q, topk=max_k, mode=args.mode, **_filter_kwargs(args))
+
+    if args.backend == "stub":
+        generate_fn = stub_generate
+    else:
+        gen = LemmaGenerator(backend=args.backend, model=args.model, temperature=args.temp)
+
+        def generate_fn(case, examples, n, tried):
+            prompt = build_proof_prompt_from_examples(case["input"], examples, max_examples=len(examples),
+                                                      layout=args.prompt_layout)
+            outs = [gen.generate(prompt) for _ in range(n)]
+            # LemmaGenerator 는 실패를 "[ERROR ...]" 문자열로 돌려줌 → 검증기로 보내지 않음
+            proofs = [o for o in outs if o and not o.startswith("[ERROR")]
+            if not proofs and outs:
+                raise RuntimeError(outs[0])  # 전부 실패면 생성 오류(gen_err)로 기록
+            return proofs
+
+    verify_workers = args.verify_workers
+    if args.verifier == "stub":
+        verify_fn = stub_verify
+    else:
+        verify_fn = _isabelle_verifier(args)
+        verify_workers = 1
+
+    results, report = run_closed_loop(
+        cases, retrieve_fn, _hits_to_examples, generate_fn, verify_fn, ladder,
+        gen_workers=args.gen_workers, verify_workers=verify_workers,
+    )
+    out = {"report": report, "cases": results}
+    if args.out:
+        _save_json(out, args.out)
+    else:
+        print(json.dumps(out, ensure_ascii=False, indent=2))
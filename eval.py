@@ -9,7 +9,9 @@ import sys
 import time
 from datetime import datetime
 from pathlib import Path
-from typing import Iterable, Tuple, Optional
+from typing import Callable, Iterable, Tuple, Optional
+
+from src.compact import COMPACT_FORMAT, iter_compact
 
 CODE_FENCE_RE = re.compile(r"```isabelle\s*(.*?)```", re.S)
 LEMMA_NAME_RE = re.compile(r"\blemma\s+([A-Za-z0-9_']+)")
@@ -111,51 +113,144 @@ def run_isabelle_build(root: Path, session: str, extra_args: Optional[list] = No
 def tail(s: str, n: int = 2000) -> str:
     return s if len(s) <= n else s[-n:]
 
-def load_items(jsonl_path: Path) -> Iterable[dict]:
-    text = jsonl_path.read_text(encoding="utf-8").strip()
+def _parse_line(line: str) -> Optional[dict]:
+    try:
+        obj = json.loads(line)
+        return obj if isinstance(obj, dict) else None
+    except Exception:
+        return {"_raw": line, "error": "invalid jsonl line"}
+
+def open_items(jsonl_path: Path) -> Tuple[int, Iterable[dict]]:
+    """
+    Single pass over the input. Returns (total, items).
+    - compact (rag-compact/1): header line carries the case count, cases are streamed by src.compact.iter_compact
+    - JSON array: read and parsed once
+    - JSONL: read and parsed once
+    """
+    f = jsonl_path.open("r", encoding="utf-8")
+    first = f.readline()
+    try:
+        head = json.loads(first)
+    except Exception:
+        head = None
+    if isinstance(head, dict) and head.get("format") == COMPACT_FORMAT:
+        f.close()
+        header, cases = iter_compact(str(jsonl_path))
+        return int(header.get("cases", 0)), cases
+
+    with f:
+        text = (first + f.read()).strip()
     # Try JSON array
     try:
         data = json.loads(text)
         if isinstance(data, list):
-            for obj in data:
-                if isinstance(obj, dict):
-                    yield obj
-            return
+            items = [obj for obj in data if isinstance(obj, dict)]
+            return len(items), iter(items)
     except Exception:
         pass
     # Fallback JSONL
+    items = []
     for line in text.splitlines():
         line = line.strip()
         if not line:
             continue
-        try:
-            obj = json.loads(line)
-            if isinstance(obj, dict):
-                yield obj
-        except Exception:
-            yield {"_raw": line, "error": "invalid jsonl line"}
-
-def count_items(jsonl_path: Path) -> int:
-    text = jsonl_path.read_text(encoding="utf-8").strip()
+        obj = _parse_line(line)
+        if obj is not None:
+            items.append(obj)
+    return len(items), iter(items)
+
+def verify_one(idx: int, inp_raw: str, prf_raw: str, thy_path: Path, thy_orig: str, root_path: Path,
+               session: str, timeout: int = 1800, dry_run: bool = False,
+               progress: Optional[Callable[[str], None]] = None) -> Tuple[dict, str]:
+    """
+    Patch one (input, proof) into the .thy file, build the session and restore the file.
+    Returns (report record, short status message). The record has "success": True only on a clean build.
+    """
+    inp = strip_isabelle_fence(inp_raw)
+    prf = strip_isabelle_fence(prf_raw)
+
+    if not inp.strip():
+        return {"index": idx, "error": "missing_input"}, f"skip idx={idx} missing_input"
+    if not prf.strip():
+        return {
+            "index": idx,
+            "input_lemma_guess": lemma_name_from_input(inp),
+            "result": "no_proof",
+        }, f"skip idx={idx} no_proof"
+
+    full_block = inp.strip()
+    if not full_block.endswith("\n"):
+        full_block += "\n"
+    full_block += "\t" + prf.strip()
+
+    lemma_name = lemma_name_from_input(full_block)
+    if not lemma_name:
+        return {"index": idx, "error": "lemma_name_not_found"}, f"fail idx={idx} lemma_name_not_found"
+
+    new_thy_text, ok = replace_lemma_block(thy_orig, lemma_name, full_block)
+    if not ok:
+        return {
+            "index": idx,
+            "lemma": lemma_name,
+            "error": f"lemma_block_not_found_in_file: {thy_path.name}",
+        }, f"fail idx={idx} block_not_found {lemma_name}"
+
+    backup_path = thy_path.with_suffix(".thy.bak_tmp")
     try:
-        data = json.loads(text)
-        if isinstance(data, list):
-            return sum(1 for x in data if isinstance(x, dict))
-    except Exception:
-        pass
-    # JSONL count
-    c = 0
-    for line in text.splitlines():
-        line = line.strip()
-        if not line:
-            continue
+        backup_path.write_text(thy_orig, encoding="utf-8")
+        thy_path.write_text(new_thy_text, encoding="utf-8")
+
+        if dry_run:
+            return {
+                "time": datetime.utcnow().isoformat() + "Z",
+                "index": idx,
+                "lemma": lemma_name,
+                "status": "dry_run",
+                "thy": str(thy_path),
+                "session": session,
+            }, f"dry idx={idx} {lemma_name}"
+
+        if progress:
+            progress(f"build idx={idx} {lemma_name}")
+        rc, out, err = run_isabelle_build(root=root_path, session=session, timeout=timeout)
+        success = (rc == 0) and (f"Finished {session}" in out)
+        return {
+            "time": datetime.utcnow().isoformat() + "Z",
+            "index": idx,
+            "lemma": lemma_name,
+            "returncode": rc,
+            "stdout_tail": tail(out, 4000),
+            "stderr_tail": tail(err, 4000),
+            "success": success,
+            "thy": str(thy_path),
+            "session": session,
+        }, f"{'ok' if success else 'fail'} idx={idx} rc={rc} {lemma_name}"
+
+    except subprocess.TimeoutExpired as te:
+        return {
+            "time": datetime.utcnow().isoformat() + "Z",
+            "index": idx,
+            "lemma": lemma_name,
+            "error": f"timeout: {te}",
+            "thy": str(thy_path),
+            "session": session,
+        }, f"timeout idx={idx} {lemma_name}"
+    except Exception as e:
+        return {
+            "time": datetime.utcnow().isoformat() + "Z",
+            "index": idx,
+            "lemma": lemma_name,
+            "error": f"{type(e).__name__}: {e}",
+            "thy": str(thy_path),
+            "session": session,
+        }, f"error idx={idx} {type(e).__name__}"
+    finally:
         try:
-            obj = json.loads(line)
-            if isinstance(obj, dict):
-                c += 1
+            thy_path.write_text(thy_orig, encoding="utf-8")
         except Exception:
-            c += 1
-    return c
+            pass
+        if backup_path.exists():
+            backup_path.unlink(missing_ok=True)
 
 # -------- Main --------
 def main():
@@ -178,11 +273,11 @@ def main():
 
     thy_orig = thy_path.read_text(encoding="utf-8")
 
-    total = count_items(jsonl_path)
+    total, items = open_items(jsonl_path)
     prog = Progress(total=total, mode=args.progress, label="items")
 
     with out_path.open("w", encoding="utf-8") as fout:
-        for idx, item in enumerate(load_items(jsonl_path), 1):
+        for idx, item in enumerate(items, 1):
             # Progress header per item
             prog.update_line(f"start idx={idx}")
 
@@ -196,127 +291,15 @@ def main():
                 prog.step()
                 continue
 
-            inp_raw = item.get("input", "") or ""
-            prf_raw = item.get("proof", "") or ""
-
-            inp = strip_isabelle_fence(inp_raw)
-            prf = strip_isabelle_fence(prf_raw)
-
-            if not inp.strip():
-                fout.write(json.dumps({"index": idx, "error": "missing_input"}, ensure_ascii=False) + "\n")
-                prog.update_line(f"skip idx={idx} missing_input")
-                prog.step()
-                continue
-            if not prf.strip():
-                fout.write(json.dumps({
-                    "index": idx,
-                    "input_lemma_guess": lemma_name_from_input(inp),
-                    "result": "no_proof",
-                }, ensure_ascii=False) + "\n")
-                prog.update_line(f"skip idx={idx} no_proof")
-                prog.step()
-                continue
-
-            full_block = inp.strip()
-            if not full_block.endswith("\n"):
-                full_block += "\n"
-            full_block += "\t" + prf.strip()
-
-            lemma_name = lemma_name_from_input(full_block)
-            if not lemma_name:
-                fout.write(json.dumps({"index": idx, "error": "lemma_name_not_found"}, ensure_ascii=False) + "\n")
-                prog.update_line(f"fail idx={idx} lemma_name_not_found")
-                prog.step()
-                continue
-
-            new_thy_text, ok = replace_lemma_block(thy_orig, lemma_name, full_block)
-            if not ok:
-                fout.write(json.dumps({
-                    "index": idx,
-                    "lemma": lemma_name,
-                    "error": f"lemma_block_not_found_in_file: {thy_path.name}",
-                }, ensure_ascii=False) + "\n")
-                prog.update_line(f"fail idx={idx} block_not_found {lemma_name}")
-                prog.step()
-                continue
-
-            try:
-                backup_path = thy_path.with_suffix(".thy.bak_tmp")
-                backup_path.write_text(thy_orig, encoding="utf-8")
-
-                thy_path.write_text(new_thy_text, encoding="utf-8")
-
-                if args.dry_run:
-                    result = {
-                        "time": datetime.utcnow().isoformat() + "Z",
-                        "index": idx,
-                        "lemma": lemma_name,
-                        "status": "dry_run",
-                        "thy": str(thy_path),
-                        "session": args.session,
-                    }
-                    fout.write(json.dumps(result, ensure_ascii=False) + "\n")
-                    thy_path.write_text(thy_orig, encoding="utf-8")
-                    if backup_path.exists():
-                        backup_path.unlink(missing_ok=True)
-                    prog.update_line(f"dry idx={idx} {lemma_name}")
-                    prog.step()
-                    continue
-
-                prog.update_line(f"build idx={idx} {lemma_name}")
-                rc, out, err = run_isabelle_build(root=root_path, session=args.session, timeout=args.timeout)
-                success = (rc == 0) and (f"Finished {args.session}" in out)
-
-                result = {
-                    "time": datetime.utcnow().isoformat() + "Z",
-                    "index": idx,
-                    "lemma": lemma_name,
-                    "returncode": rc,
-                    "stdout_tail": tail(out, 4000),
-                    "stderr_tail": tail(err, 4000),
-                    "success": success,
-                    "thy": str(thy_path),
-                    "session": args.session,
-                }
-                fout.write(json.dumps(result, ensure_ascii=False) + "\n")
-                fout.flush()
-
-                prog.update_line(f"{'ok' if success else 'fail'} idx={idx} rc={rc} {lemma_name}")
-
-            except subprocess.TimeoutExpired as te:
-                thy_path.write_text(thy_orig, encoding="utf-8")
-                fout.write(json.dumps({
-                    "time": datetime.utcnow().isoformat() + "Z",
-                    "index": idx,
-                    "lemma": lemma_name,
-                    "error": f"timeout: {te}",
-                    "thy": str(thy_path),
-                    "session": args.session,
-                }, ensure_ascii=False) + "\n")
-                prog.update_line(f"timeout idx={idx} {lemma_name}")
-            except Exception as e:
-                try:
-                    thy_path.write_text(thy_orig, encoding="utf-8")
-                except Exception:
-                    pass
-                fout.write(json.dumps({
-                    "time": datetime.utcnow().isoformat() + "Z",
-                    "index": idx,
-                    "lemma": lemma_name,
-                    "error": f"{type(e).__name__}: {e}",
-                    "thy": str(thy_path),
-                    "session": args.session,
-                }, ensure_ascii=False) + "\n")
-                prog.update_line(f"error idx={idx} {type(e).__name__}")
-            finally:
-                try:
-                    thy_path.write_text(thy_orig, encoding="utf-8")
-                except Exception:
-                    pass
-                backup = thy_path.with_suffix(".thy.bak_tmp")
-                if backup.exists():
-                    backup.unlink(missing_ok=True)
-                prog.step()
+            result, msg = verify_one(
+                idx, item.get("input", "") or "", item.get("proof", "") or "",
+                thy_path=thy_path, thy_orig=thy_orig, root_path=root_path, session=args.session,
+                timeout=args.timeout, dry_run=args.dry_run, progress=prog.update_line,
+            )
+            fout.write(json.dumps(result, ensure_ascii=False) + "\n")
+            fout.flush()
+            prog.update_line(msg)
+            prog.step()
 
     prog.close()
 
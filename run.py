@@ -9,6 +9,7 @@ def main():
     # 색인
     p = sub.add_parser("index", help="JSONL 색인 → Chroma")
     p.add_argument("--jsonl", default=None)
+    p.add_argument("--shard", default=None, help="i/N: source_file 해시 기준 N 분할 중 i 번째 샤드만 색인")
     p.set_defaults(func=cmd_index)
 
     # retrieval
@@ -16,36 +17,97 @@ def main():
     p.add_argument("query", nargs="?", help="--test-jsonl 없을 때만 필요")
     p.add_argument("--mode", choices=["dense", "bm25"], default="dense")
     p.add_argument("--topk", type=int, default=5)
+    p.add_argument("--shards", type=int, default=1, help="N>1: 샤드 워커 N개로 scatter-gather 검색 (index --shard i/N 로 색인 필요)")
+    # 메타데이터 사전 필터
+    p.add_argument("--path-prefix", default=None, help="source_file 접두사 (예: l4v/lib/)")
+    p.add_argument("--types", default=None, help="허용 type 목록, 쉼표 구분 (예: lemma,lemmas)")
+    p.add_argument("--exclude-file", default=None, help="제외할 source_file (대상 theory 누설 방지)")
     p.add_argument("--test-jsonl", default=None, help="테스트 파일(JSONL; {input, gt})")
+    p.add_argument("--speculative", action="store_true",
+                   help="설명 LLM 호출 중 원문 lemma 로 dense/bm25 검색을 먼저 수행하고, 설명이 오면 병합")
+    p.add_argument("--spec-deadline", type=float, default=10.0,
+                   help="설명 대기 한도(초, 케이스 시작 기준). 넘기면 추측 검색 결과만 사용")
     p.add_argument("--out", default=None, help="저장할 JSON 경로")
+    p.add_argument("--compact", action="store_true", help="hit 은 row_idx/score 참조, prompt 는 해시 + 사이드 스토어로 저장 (--out 필요)")
     # 생성 옵션
     p.add_argument("--gen", action="store_true")
     p.add_argument("--k", type=int, default=ANSWER_TOPK)
     p.add_argument("--backend", choices=["openai", "vllm"], default="vllm")
     p.add_argument("--model", default="gpt-4o-mini")
     p.add_argument("--temp", type=float, default=0.1)
+    p.add_argument("--prompt-layout", choices=["default", "prefix"], default="default",
+                   help="prefix: 고정 system 블록 → 정규 순서 레퍼런스 → Target (vLLM prefix caching 최적화)")
     p.set_defaults(func=cmd_retrieval)
 
     # search
     p = sub.add_parser("search", help="Hybrid 검색 → JSON")
     p.add_argument("query", nargs="?", help="--test-jsonl 없을 때만 필요")
     p.add_argument("--final_n", type=int, default=10)
+    p.add_argument("--shards", type=int, default=1, help="N>1: 샤드 워커 N개로 scatter-gather 검색 (index --shard i/N 로 색인 필요)")
+    # 메타데이터 사전 필터
+    p.add_argument("--path-prefix", default=None, help="source_file 접두사 (예: l4v/lib/)")
+    p.add_argument("--types", default=None, help="허용 type 목록, 쉼표 구분 (예: lemma,lemmas)")
+    p.add_argument("--exclude-file", default=None, help="제외할 source_file (대상 theory 누설 방지)")
     p.add_argument("--test-jsonl", default=None)
     p.add_argument("--out", default=None)
+    p.add_argument("--compact", action="store_true", help="hit 은 row_idx/score 참조, prompt 는 해시 + 사이드 스토어로 저장 (--out 필요)")
     # 생성 옵션
     p.add_argument("--gen", action="store_true")
     p.add_argument("--k", type=int, default=ANSWER_TOPK)
     p.add_argument("--backend", choices=["openai", "vllm"], default="vllm")
     p.add_argument("--model", default="gpt-4o-mini")
     p.add_argument("--temp", type=float, default=0.1)
+    p.add_argument("--prompt-layout", choices=["default", "prefix"], default="default",
+                   help="prefix: 고정 system 블록 → 정규 순서 레퍼런스 → Target (vLLM prefix caching 최적화)")
     p.set_defaults(func=cmd_search)
 
+    # prove: 생성 → 검증 → 재시도 폐루프
+    p = sub.add_parser("prove", help="생성 → 검증 → 재시도 폐루프 스케줄러 → JSON")
+    p.add_argument("--test-jsonl", required=True)
+    p.add_argument("--out", default=None)
+    p.add_argument("--mode", choices=["dense", "bm25", "hybrid"], default="hybrid")
+    # 메타데이터 사전 필터
+    p.add_argument("--path-prefix", default=None, help="source_file 접두사 (예: l4v/lib/)")
+    p.add_argument("--types", default=None, help="허용 type 목록, 쉼표 구분 (예: lemma,lemmas)")
+    p.add_argument("--exclude-file", default=None,
+                   help="제외할 source_file (기본: --thy 를 --root 기준 코퍼스 경로로 바꾼 값)")
+    p.add_argument("--ladder", default="2:1,5:1,10:3",
+                   help="시도별 레퍼런스 수:후보 수, 쉼표 구분 (길이 = 케이스당 시도 예산)")
+    p.add_argument("--gen-workers", type=int, default=2)
+    p.add_argument("--verify-workers", type=int, default=1, help="stub 검증기에서만 의미 있음 (isabelle 은 1 고정)")
+    p.add_argument("--backend", choices=["openai", "vllm", "stub"], default="vllm")
+    p.add_argument("--model", default="gpt-4o-mini")
+    p.add_argument("--temp", type=float, default=0.1)
+    p.add_argument("--prompt-layout", choices=["default", "prefix"], default="default")
+    p.add_argument("--verifier", choices=["isabelle", "stub"], default="isabelle")
+    p.add_argument("--thy", default=None, help="패치할 .thy 파일 (--verifier isabelle)")
+    p.add_argument("--session", default=None, help="Isabelle 세션 이름 (--verifier isabelle)")
+    p.add_argument("--root", default=".", help="isabelle build -d 루트")
+    p.add_argument("--timeout", type=int, default=1800)
+    p.set_defaults(func=cmd_prove)
+
     args = ap.parse_args()
+    if args.cmd == "prove":
+        if args.verifier == "isabelle" and not (args.thy and args.session):
+            ap.error("--verifier isabelle 은 --thy 와 --session 이 필요합니다.")
+        try:
+            parse_ladder(args.ladder)
+        except ValueError:
+            ap.error("--ladder 는 k:n[,k:n...] 형식이어야 합니다.")
+    if getattr(args, "shard", None):
+        try:
+            i, n = (int(x) for x in args.shard.split("/"))
+        except ValueError:
+            ap.error("--shard 는 i/N 형식이어야 합니다 (0 <= i < N).")
+        if not 0 <= i < n:
+            ap.error("--shard 는 i/N 형식이어야 합니다 (0 <= i < N).")
     if getattr(args, "cmd", None) in ("retrieval", "search"):
         has_test_jsonl = getattr(args, "test_jsonl", None)
         has_query = getattr(args, "query", None)
         if not has_test_jsonl and has_query is None:
             ap.error("query가 필요합니다(또는 --test-jsonl).")
+        if getattr(args, "compact", False) and not args.out:
+            ap.error("--compact 는 --out 과 함께 사용해야 합니다.")
     args.func(args)
 
 if __name__ == "__main__":
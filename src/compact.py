@@ -0,0 +1,76 @@
+# compact.py
+import hashlib, json, os
+from typing import List, Dict, Iterable
+from src.config import JSONL_PATH
+
+# 헤더 1줄 + 케이스당 1줄(JSONL). hit 은 코퍼스 row_idx/score 참조, prompt 는 해시 + 사이드 스토어 참조
+COMPACT_FORMAT = "rag-compact/1"
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+def prompt_store_path(out_path: str) -> str:
+    # result/x.json → result/x.prompts.jsonl
+    return os.path.splitext(out_path)[0] + ".prompts.jsonl"
+
+def compact_case(res: Dict) -> Dict:
+    out = {k: v for k, v in res.items() if k not in ("prompt", "hits")}
+    prompt = res.get("prompt")
+    out["prompt_sha256"] = prompt_hash(prompt) if prompt else None
+    # score = 검색 점수 (search 결과의 "score" 는 코퍼스 메타 점수라 rrf_score 를 사용)
+    out["hits"] = [{"row_idx": h.get("row_idx"), "score": h["rrf_score"] if "rrf_score" in h else h.get("score")}
+                   for h in res.get("hits") or []]
+    return out
+
+def save_compact(results: List[Dict], out_path: str, corpus_path: str = JSONL_PATH):
+    store_path = prompt_store_path(out_path)
+    seen = set()
+    with open(store_path, "w", encoding="utf-8") as f:
+        for res in results:
+            prompt = res.get("prompt")
+            if not prompt:
+                continue
+            h = prompt_hash(prompt)
+            if h in seen:
+                continue
+            seen.add(h)
+            f.write(json.dumps({"sha256": h, "prompt": prompt}, ensure_ascii=False) + "\n")
+    header = {
+        "format": COMPACT_FORMAT,
+        "cases": len(results),
+        "corpus": os.path.abspath(corpus_path),  # 다른 디렉터리에서 읽어도 resolve_hits 가 동작하도록
+        "prompt_store": os.path.relpath(store_path, os.path.dirname(out_path) or "."),
+    }
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        for res in results:
+            f.write(json.dumps(compact_case(res), ensure_ascii=False) + "\n")
+    print(f"[INFO] compact 결과를 {out_path} 에 저장했습니다. (prompts: {store_path})")
+
+# ---------- 읽기 ----------
+def iter_compact(path: str):
+    """(header, case 이터레이터) — 케이스는 소비할 때 파일을 열어 한 줄씩 스트리밍 (eval.py 가 사용)"""
+    with open(path, "r", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+    if header.get("format") != COMPACT_FORMAT:
+        raise ValueError(f"not a {COMPACT_FORMAT} file: {path}")
+
+    def cases():
+        with open(path, "r", encoding="utf-8") as f:
+            f.readline()  # 헤더
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    return header, cases()
+
+def resolve_hits(hits: Iterable[Dict], corpus_path: str) -> List[Dict]:
+    # row_idx 참조 → 코퍼스 레코드 복원 (검색 점수는 hit_score), 필요한 행까지만 읽음
+    want = {h["row_idx"]: h for h in hits if h.get("row_idx") is not None}
+    found = {}
+    with open(corpus_path, "r", encoding="utf-8") as f:
+        for row_idx, line in enumerate(f):
+            if row_idx in want:
+                found[row_idx] = dict(json.loads(line), row_idx=row_idx, hit_score=want[row_idx].get("score"))
+                if len(found) == len(want):
+                    break
+    return [found[r] for r in want if r in found]
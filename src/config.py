@@ -4,6 +4,7 @@ JSONL_PATH = "./data/isabelle_judge.jsonl"
 PERSIST_DIR = "chroma_store"
 COLLECTION = "rag_collection"
 EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+TOKEN_CACHE_DIR = "token_cache"  # BM25 어휘/토큰 ID 캐시
 
 DENSE_TOPK = 5
 ANSWER_TOPK = 5
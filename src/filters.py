@@ -0,0 +1,80 @@
+# filters.py
+from bisect import bisect_left
+from typing import List, Dict, Optional, Iterable
+import numpy as np
+
+class MetaIndex:
+    """
+    source_file / type 메타데이터 사전 필터용 인덱스 (코퍼스 로드 시 1회 구축)
+    - by_file: source_file → 위치 posting 배열, files: 정렬된 파일 목록(접두사 탐색용)
+    - type_bits: type → 길이 N bool 비트맵
+    위치 = records 리스트 인덱스
+    """
+    def __init__(self, records: List[Dict]):
+        self.n = len(records)
+        by_file, by_type = {}, {}
+        for pos, rec in enumerate(records):
+            by_file.setdefault(rec.get("source_file", ""), []).append(pos)
+            by_type.setdefault(rec.get("type", ""), []).append(pos)
+        self.by_file = {f: np.asarray(p, dtype=np.int64) for f, p in by_file.items()}
+        self.files = sorted(self.by_file)
+        self.type_bits = {}
+        for t, p in by_type.items():
+            bits = np.zeros(self.n, dtype=bool)
+            bits[p] = True
+            self.type_bits[t] = bits
+
+    def files_with_prefix(self, prefix: str) -> List[str]:
+        i = bisect_left(self.files, prefix)
+        out = []
+        while i < len(self.files) and self.files[i].startswith(prefix):
+            out.append(self.files[i])
+            i += 1
+        return out
+
+    def _file_set(self, path_prefix: Optional[str], exclude_file: Optional[str]) -> Optional[List[str]]:
+        # None = 파일 조건 없음
+        if path_prefix is None:
+            return None
+        return [f for f in self.files_with_prefix(path_prefix) if f != exclude_file]
+
+    def select(self, path_prefix: Optional[str] = None, types: Optional[Iterable[str]] = None,
+               exclude_file: Optional[str] = None) -> Optional[np.ndarray]:
+        """
+        허용 위치(오름차순 int 배열) 반환. 필터가 하나도 없으면 None (전체 코퍼스)
+        """
+        if path_prefix is None and not types and exclude_file is None:
+            return None
+        files = self._file_set(path_prefix, exclude_file)
+        if files is not None:
+            mask = np.zeros(self.n, dtype=bool)
+            for f in files:
+                mask[self.by_file[f]] = True
+        else:
+            mask = np.ones(self.n, dtype=bool)
+            if exclude_file in self.by_file:
+                mask[self.by_file[exclude_file]] = False
+        if types:
+            tmask = np.zeros(self.n, dtype=bool)
+            for t in types:
+                if t in self.type_bits:
+                    tmask |= self.type_bits[t]
+            mask &= tmask
+        return np.flatnonzero(mask)
+
+    def where(self, path_prefix: Optional[str] = None, types: Optional[Iterable[str]] = None,
+              exclude_file: Optional[str] = None) -> Optional[Dict]:
+        """
+        같은 조건의 Chroma where 절 (접두사는 인덱스로 파일 목록 $in 으로 전개)
+        """
+        conds = []
+        files = self._file_set(path_prefix, exclude_file)
+        if files is not None:
+            conds.append({"source_file": {"$in": files}})
+        elif exclude_file is not None:
+            conds.append({"source_file": {"$nin": [exclude_file]}})
+        if types:
+            conds.append({"type": {"$in": list(types)}})
+        if not conds:
+            return None
+        return conds[0] if len(conds) == 1 else {"$and": conds}
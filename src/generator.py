@@ -4,8 +4,23 @@ from textwrap import dedent
 import requests
 import src.config as config
 
-def build_proof_prompt_from_examples(query_input: str, examples: List[Dict], max_examples: int = 5) -> str:
+def reference_key(ex: Dict):
+    # 캐시 친화 정렬 키: 같은 레퍼런스는 어떤 케이스에서든 같은 키를 가짐
+    return ((ex.get("source_file") or ""), (ex.get("snippet") or "").strip(), (ex.get("explanation") or "").strip())
+
+def canonical_references(examples: List[Dict]) -> List[Dict]:
+    return sorted(examples, key=reference_key)
+
+def build_proof_prompt_from_examples(query_input: str, examples: List[Dict], max_examples: int = 5,
+                                     layout: str = "default") -> str:
+    """
+    layout: "default" | "prefix"
+    prefix → [고정 system 블록 + 출력 규칙] → [정규 순서 레퍼런스] → [Target 입력] 순으로 배치해
+    vLLM automatic prefix caching 이 공유 접두부를 최대한 재사용하도록 함
+    """
     examples = examples[:max_examples]
+    if layout == "prefix":
+        examples = canonical_references(examples)
     ex_blocks = []
     for i, ex in enumerate(examples, 1):
         exp = (ex.get("explanation") or "").strip()
@@ -18,11 +33,7 @@ EXPLANATION:
 SNIPPET (lemma and proof):
 {snp}""")
     context = "\n\n".join(ex_blocks) if ex_blocks else "(no references available)"
-    target = f"""### Target:
-INPUT (lemma to prove):
-{query_input.strip()}
-
-REQUIRED OUTPUT:
+    output_rules = """REQUIRED OUTPUT:
 - ONLY the Isabelle proof script that closes this lemma.
 - Do not echo the lemma. No commentary. Proof script only.
 """
@@ -30,13 +41,27 @@ REQUIRED OUTPUT:
 Use the given References (explanation + snippet examples) to infer tactic/style patterns.
 Produce a concise, correct proof for the Target INPUT using standard tactics.
 Return ONLY the proof script (no extra text)."""
+    if layout == "prefix":
+        target = f"""### Target:
+INPUT (lemma to prove):
+{query_input.strip()}
+"""
+        return f"{system_rules}\n\n{output_rules}\n# References\n{context}\n\n{target}"
+    target = f"""### Target:
+INPUT (lemma to prove):
+{query_input.strip()}
+
+{output_rules}"""
     return f"{system_rules}\n\n# References\n{context}\n\n{target}"
 
 class LemmaGenerator:
-    def __init__(self, backend: str = "echo", model: str = "gpt-4o-mini", temperature: float = 0.1):
+    def __init__(self, backend: str = "echo", model: str = "gpt-4o-mini", temperature: float = 0.1,
+                 timeout: float = None):
         self.backend = backend
         self.model = model
         self.temperature = temperature
+        self.timeout = timeout  # 요청 타임아웃(초). None 이면 vLLM 60초, OpenAI 클라이언트 기본값
+        self.last_usage = None  # 직전 호출의 {prompt_tokens, cached_tokens} (서버가 주는 경우)
 
     def generate(self, prompt: str) -> str:
         def extract_proof(s: str) -> str:
@@ -48,6 +73,19 @@ class LemmaGenerator:
             code = m.group(1) if m else s
             return code.strip()
 
+        def read_usage(usage) -> Dict:
+            # prompt_tokens_details.cached_tokens: OpenAI / vLLM(--enable-prompt-tokens-details)
+            if usage is None:
+                return None
+            if not isinstance(usage, dict):
+                usage = usage.model_dump() if hasattr(usage, "model_dump") else {}
+            details = usage.get("prompt_tokens_details") or {}
+            return {
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "cached_tokens": details.get("cached_tokens"),
+            }
+
+        self.last_usage = None
         if self.backend == "openai":
             if not config.openai_key:
                 return "[ERROR] No openai_key in api_key.json"
@@ -61,7 +99,9 @@ class LemmaGenerator:
                         {"role": "user", "content": prompt},
                     ],
                     temperature=self.temperature,
+                    **({"timeout": self.timeout} if self.timeout is not None else {}),
                 )
+                self.last_usage = read_usage(resp.usage)
                 return extract_proof((resp.choices[0].message.content or "").strip())
             except Exception as e:
                 return f"[ERROR OpenAI] {e}"
@@ -80,10 +120,11 @@ class LemmaGenerator:
                         ],
                         "temperature": self.temperature,
                     },
-                    timeout=60,
+                    timeout=self.timeout if self.timeout is not None else 60,
                 )
                 resp.raise_for_status()
                 data = resp.json()
+                self.last_usage = read_usage(data.get("usage"))
                 return extract_proof(data["choices"][0]["message"]["content"].strip())
             except Exception as e:
                 return f"[ERROR VLLM] {e}"
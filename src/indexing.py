@@ -1,4 +1,4 @@
-import json, uuid
+import json, sys, uuid, zlib
 import chromadb
 from chromadb.utils import embedding_functions
 from src.config import JSONL_PATH, PERSIST_DIR, COLLECTION, EMBED_MODEL
@@ -7,10 +7,23 @@ def build_content(rec):
     # explanation 중심 + 최소 컨텍스트(prefix)
     return f"[type={rec.get('type','')}] file={rec.get('source_file','')}\n{rec.get('explanation','')}"
 
-def index_jsonl(jsonl_path=JSONL_PATH):
+def shard_of(rec, num_shards: int) -> int:
+    # source_file 해시 기준 → 같은 theory 파일은 항상 같은 샤드
+    return zlib.crc32((rec.get("source_file") or "").encode("utf-8")) % num_shards
+
+def collection_name(shard=None) -> str:
+    # shard: (i, N) 또는 None(단일 인덱스)
+    return COLLECTION if shard is None else f"{COLLECTION}_s{shard[0]}of{shard[1]}"
+
+def index_jsonl(jsonl_path=JSONL_PATH, shard=None):
+    """
+    shard: (i, N) 이면 shard_of(rec, N) == i 인 레코드만 '{COLLECTION}_s{i}of{N}' 에 색인
+    row_idx 는 전체 JSONL 기준 행번호를 그대로 유지 (샤드 간 병합용)
+    """
+    name = collection_name(shard)
     client = chromadb.PersistentClient(path=PERSIST_DIR)
     emb_fn = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBED_MODEL)
-    col = client.get_or_create_collection(name=COLLECTION, embedding_function=emb_fn)
+    col = client.get_or_create_collection(name=name, embedding_function=emb_fn)
 
     ids, docs, metadatas = [], [], []
     with open(jsonl_path, "r", encoding="utf-8") as f:
@@ -19,6 +32,8 @@ def index_jsonl(jsonl_path=JSONL_PATH):
             if not line:
                 continue
             rec = json.loads(line)
+            if shard is not None and shard_of(rec, shard[1]) != shard[0]:
+                continue
 
             content = build_content(rec)
             meta = {
@@ -38,4 +53,7 @@ def index_jsonl(jsonl_path=JSONL_PATH):
     for i in range(0, len(ids), BATCH):
         col.add(ids=ids[i:i+BATCH], documents=docs[i:i+BATCH], metadatas=metadatas[i:i+BATCH])
 
-    print(f"[indexing] Indexed {len(ids)} docs -> '{COLLECTION}' ({PERSIST_DIR})")
\ No newline at end of file
+    print(f"[indexing] Indexed {len(ids)} docs -> '{name}' ({PERSIST_DIR})")
+    if not ids:
+        where = f"shard {shard[0]}/{shard[1]} (source_file 해시로 배정된 레코드 없음)" if shard is not None else jsonl_path
+        print(f"[WARN] 색인된 문서가 0개입니다: {where}", file=sys.stderr)
\ No newline at end of file
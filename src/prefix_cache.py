@@ -0,0 +1,67 @@
+# prefix_cache.py
+import sys
+from typing import List, Dict, Optional
+from src.generator import canonical_references, reference_key
+
+# ---------- 배치 정렬 ----------
+def order_for_prefix_reuse(jobs: List[Dict]) -> List[Dict]:
+    """
+    jobs: [{"examples": [...], ...}]
+    정규 순서 레퍼런스 키 튜플로 사전식 정렬 → 같은 레퍼런스(접두부)를 공유하는 케이스끼리 인접
+    (트라이 전위 순회와 동일한 순서라 인접 케이스 간 공유 접두부가 최대가 됨)
+    """
+    return sorted(jobs, key=lambda j: [reference_key(ex) for ex in canonical_references(j["examples"])])
+
+def _common_prefix_len(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+# ---------- 절감량 집계 ----------
+class PrefixCacheStats:
+    """
+    서버 측정값(usage.prompt_tokens_details.cached_tokens)과
+    문자 기준 추정값(직전 프롬프트와의 공통 접두부, 캐시 축출을 가정한 보수적 하한)을 함께 집계
+    """
+    def __init__(self):
+        self.n = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.measured = 0
+        self.prompt_chars = 0
+        self.shared_chars = 0
+        self._prev = ""
+
+    def add(self, prompt: str, usage: Optional[Dict] = None):
+        self.n += 1
+        self.prompt_chars += len(prompt)
+        self.shared_chars += _common_prefix_len(prompt, self._prev)
+        self._prev = prompt
+        if usage and usage.get("prompt_tokens") is not None:
+            self.prompt_tokens += usage["prompt_tokens"]
+            if usage.get("cached_tokens") is not None:
+                self.cached_tokens += usage["cached_tokens"]
+                self.measured += 1
+
+    def summary(self) -> Dict:
+        return {
+            "prompts": self.n,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens if self.measured else None,
+            "cached_ratio": (self.cached_tokens / self.prompt_tokens) if self.measured and self.prompt_tokens else None,
+            "prompt_chars": self.prompt_chars,
+            "shared_prefix_chars": self.shared_chars,
+            "shared_prefix_ratio": (self.shared_chars / self.prompt_chars) if self.prompt_chars else 0.0,
+        }
+
+    def report(self, file=sys.stderr):
+        s = self.summary()
+        if s["cached_tokens"] is not None:
+            measured = f"cached_tokens={s['cached_tokens']}/{s['prompt_tokens']} ({s['cached_ratio']*100:.1f}%)"
+        else:
+            measured = "cached_tokens=n/a (서버가 prompt_tokens_details 미제공)"
+        print(f"[prefix-cache] prompts={s['prompts']} {measured} "
+              f"est_shared_prefix={s['shared_prefix_chars']}/{s['prompt_chars']} chars "
+              f"({s['shared_prefix_ratio']*100:.1f}%)", file=file)
@@ -1,58 +1,199 @@
 # retrieval.py
-import json
+import json, os, threading
 import numpy as np
 import chromadb
 from rank_bm25 import BM25Okapi
 from chromadb.utils import embedding_functions
+from src.tokenizer import Vocab, tokenize, load_tokenized_corpus
+from src.filters import MetaIndex
+from src.indexing import shard_of, collection_name
 from src.config import (
-    PERSIST_DIR, COLLECTION, EMBED_MODEL, DENSE_TOPK,
+    PERSIST_DIR, EMBED_MODEL, DENSE_TOPK,
     JSONL_PATH  # config에 없으면 추가하세요.
 )
 
+# ---------- 코퍼스/샤드 설정 ----------
+_CORPUS_PATH = JSONL_PATH
+_SHARD = None       # (i, N): 이 프로세스가 샤드 워커면 해당 샤드만 로드
+_SHARD_POOL = None  # 코디네이터: 설정되면 retrieve() 가 샤드 워커들로 scatter-gather
+
+def configure(jsonl_path: str = None, shard=None):
+    """코퍼스 경로 / 담당 샤드 지정 (이미 로드된 인덱스는 버림)"""
+    global _CORPUS_PATH, _SHARD, _BM25_META, _META_INDEX, _BM25, _BM25_VOCAB, _POSTINGS
+    with _LOAD_LOCK:
+        _CORPUS_PATH = jsonl_path or JSONL_PATH
+        _SHARD = shard
+        _BM25_META = _META_INDEX = _BM25 = _BM25_VOCAB = _POSTINGS = None
+
+def use_shards(pool):
+    """pool: src.shards.ShardPool 또는 None(단일 프로세스 검색으로 복귀)"""
+    global _SHARD_POOL
+    _SHARD_POOL = pool
+
 # ---------- Dense (cosine) ----------
 def _get_collection():
     client = chromadb.PersistentClient(path=PERSIST_DIR)
     emb_fn = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBED_MODEL)
-    return client.get_or_create_collection(name=COLLECTION, embedding_function=emb_fn)
+    if _SHARD is None:
+        return client.get_or_create_collection(name=collection_name(_SHARD), embedding_function=emb_fn)
+    # 샤드 워커: 색인되지 않은 샤드를 빈 컬렉션으로 만들어 조용히 빈 결과를 내지 않도록 명시적으로 실패
+    name = collection_name(_SHARD)
+    hint = f"run 'python3 run.py index --shard {_SHARD[0]}/{_SHARD[1]}' first"
+    try:
+        col = client.get_collection(name=name, embedding_function=emb_fn)
+    except Exception as e:
+        raise RuntimeError(f"shard collection '{name}' not found in {PERSIST_DIR} ({hint})") from e
+    if col.count() == 0:
+        raise RuntimeError(f"shard collection '{name}' is empty ({hint})")
+    return col
 
-# ---------- BM25 (lazy load, 프로세스 1회) ----------
-_BM25 = None
+# ---------- 코퍼스 메타 + 필터 인덱스 (lazy load, 프로세스 1회) ----------
 _BM25_META = None
+_META_INDEX = None
+_LOAD_LOCK = threading.Lock()  # 추측 검색 등 스레드에서 동시 호출돼도 1회만 로드
 
-def _tokenize(s: str):
-    # 필요시 형태소 분석기로 교체
-    return s.split()
+def _ensure_meta_loaded(jsonl_path: str = None):
+    with _LOAD_LOCK:
+        _load_meta(jsonl_path or _CORPUS_PATH)
 
-def _ensure_bm25_loaded(jsonl_path: str = JSONL_PATH):
-    global _BM25, _BM25_META
-    if _BM25 is not None:
+def _load_meta(jsonl_path: str):
+    global _BM25_META, _META_INDEX
+    if _BM25_META is not None:
         return
-    tokens, meta = [], []
+    meta = []
     with open(jsonl_path, "r", encoding="utf-8") as f:
         for row_idx, line in enumerate(f):
             line = line.strip()
             if not line:
                 continue
             rec = json.loads(line)
-            text = f"{rec.get('explanation','')} {rec.get('snippet','')} {rec.get('source_file','')}"
-            tokens.append(_tokenize(text))
+            if _SHARD is not None and shard_of(rec, _SHARD[1]) != _SHARD[0]:
+                continue
             rec["row_idx"] = row_idx
             meta.append(rec)
-    _BM25 = BM25Okapi(tokens)
     _BM25_META = meta
+    _META_INDEX = MetaIndex(meta)
+
+# ---------- BM25 (lazy load, 프로세스 1회) ----------
+_BM25 = None
+_BM25_VOCAB = None
+_POSTINGS = None  # (starts, docs, tfs, doc_len): 토큰 ID t 의 posting = docs/tfs[starts[t]:starts[t+1]]
+
+def _tokenize(s: str):
+    # 질의 → 코퍼스 어휘의 정수 토큰 ID
+    return _BM25_VOCAB.encode(tokenize(s))
+
+def _build_postings(tokens, vocab_size: int):
+    # 토큰 ID → (문서 위치, tf) 역색인. (토큰, 문서) 쌍을 정렬·집계해 한 번에 구축
+    n = len(tokens)
+    lens = np.fromiter((len(d) for d in tokens), dtype=np.int64, count=n)
+    ids = np.fromiter((i for d in tokens for i in d), dtype=np.int64, count=int(lens.sum()))
+    keys, tfs = np.unique(ids * n + np.repeat(np.arange(n, dtype=np.int64), lens), return_counts=True)
+    starts = np.searchsorted(keys // n, np.arange(vocab_size + 1))
+    return starts, keys % n, tfs
+
+def _bm25_scores_allowed(q_ids, allowed: np.ndarray):
+    """
+    허용 문서만 대상으로 질의 토큰의 posting 만 채점 → 비용은 코퍼스 크기가 아닌 매칭 posting 수에 비례
+    BM25Okapi.get_scores 와 같은 식 (idf/avgdl 은 샤드 전역 통계로 교체된 값 그대로 사용)
+    반환: (문서 위치, 점수) — 점수 0 인 문서는 포함하지 않음
+    """
+    starts, docs, tfs, doc_len = _POSTINGS
+    k1, b, avgdl = _BM25.k1, _BM25.b, _BM25.avgdl
+    mask = np.zeros(len(_BM25_META), dtype=bool)
+    mask[allowed] = True
+    hit_docs, hit_vals = [], []
+    for q in q_ids:
+        d, tf = docs[starts[q]:starts[q + 1]], tfs[starts[q]:starts[q + 1]]
+        keep = mask[d]
+        d, tf = d[keep], tf[keep]
+        dl = doc_len[d]
+        hit_docs.append(d)
+        hit_vals.append((_BM25.idf.get(q) or 0) * (tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))))
+    if not hit_docs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    uniq, inv = np.unique(np.concatenate(hit_docs), return_inverse=True)
+    return uniq, np.bincount(inv, weights=np.concatenate(hit_vals), minlength=len(uniq))
+
+def _ensure_bm25_loaded(jsonl_path: str = None):
+    global _BM25, _BM25_VOCAB, _POSTINGS
+    jsonl_path = jsonl_path or _CORPUS_PATH
+    with _LOAD_LOCK:
+        if _BM25_VOCAB is not None:
+            return
+        _load_meta(jsonl_path)
+        if not _BM25_META:
+            # 빈 샤드(해시로 배정된 레코드 없음): BM25Okapi([]) 는 ZeroDivisionError → 인덱스 없이 빈 결과
+            _BM25_VOCAB = Vocab()
+            return
+        cache_key = None
+        if _SHARD is not None:
+            stem = os.path.splitext(os.path.basename(jsonl_path))[0]
+            cache_key = f"{stem}.s{_SHARD[0]}of{_SHARD[1]}"
+        tokens, _BM25_VOCAB = load_tokenized_corpus(jsonl_path, _BM25_META, cache_key=cache_key)
+        _BM25 = BM25Okapi(tokens)
+        _POSTINGS = _build_postings(tokens, len(_BM25_VOCAB)) + (np.asarray(_BM25.doc_len, dtype=np.float64),)
+
+def bm25_stats():
+    """샤드 전역 BM25 통계 집계용: 문서 수, 총 길이, 토큰별 문서 빈도(df)"""
+    _ensure_bm25_loaded()
+    if _BM25 is None:
+        return {"n": 0, "total_len": 0, "df": {}}
+    df = {}
+    for doc in _BM25.doc_freqs:
+        for tok_id in doc:
+            df[tok_id] = df.get(tok_id, 0) + 1
+    tokens = _BM25_VOCAB.id_to_token
+    return {
+        "n": _BM25.corpus_size,
+        "total_len": int(sum(_BM25.doc_len)),
+        "df": {tokens[i]: c for i, c in df.items()},
+    }
+
+def set_bm25_global_stats(idf: dict, avgdl: float):
+    """전역 idf(토큰 문자열 기준)/avgdl 로 교체 → 샤드 점수가 단일 인덱스 점수와 동일해짐"""
+    _ensure_bm25_loaded()
+    if _BM25 is None:
+        return
+    _BM25.idf = {i: idf[t] for t, i in _BM25_VOCAB.token_to_id.items() if t in idf}
+    _BM25.avgdl = avgdl
 
 # ---------- Unified API ----------
-def retrieve(query: str, topk: int = DENSE_TOPK, mode: str = "dense"):
+def retrieve(query: str, topk: int = DENSE_TOPK, mode: str = "dense",
+             path_prefix: str = None, types=None, exclude_file: str = None):
     """
     mode: "dense" | "bm25"
     반환 형식 동일(id, row_idx, document, metadata, score)
+    path_prefix / types / exclude_file: source_file 접두사, type 집합, 제외할 source_file
+    → 사전 필터(MetaIndex)로 후보를 먼저 좁힌 뒤 점수 계산
     """
+    if _SHARD_POOL is not None:
+        return _SHARD_POOL.retrieve(query, topk=topk, mode=mode, path_prefix=path_prefix,
+                                    types=types, exclude_file=exclude_file)
+
+    if _SHARD is not None:
+        # 빈 샤드는 색인도 비어 있으므로 dense/bm25 모두 빈 결과
+        _ensure_meta_loaded()
+        if not _BM25_META:
+            return []
+
+    filtered = path_prefix is not None or bool(types) or exclude_file is not None
+    if filtered:
+        _ensure_meta_loaded()
+        allowed = _META_INDEX.select(path_prefix, types, exclude_file)
+        if len(allowed) == 0:
+            return []
+
     if mode == "dense":
         col = _get_collection()
+        kwargs = {}
+        if filtered:
+            kwargs["where"] = _META_INDEX.where(path_prefix, types, exclude_file)
         res = col.query(
             query_texts=[query],
-            n_results=topk,
-            include=["metadatas", "documents", "distances"]
+            n_results=min(topk, len(allowed)) if filtered else topk,
+            include=["metadatas", "documents", "distances"],
+            **kwargs
         )
         out = []
         ids = res.get("ids", [[]])[0]
@@ -74,14 +215,29 @@ def retrieve(query: str, topk: int = DENSE_TOPK, mode: str = "dense"):
 
     elif mode == "bm25":
         _ensure_bm25_loaded()
-        scores = _BM25.get_scores(_tokenize(query))
-        order = np.argsort(scores)[::-1][:topk]
+        if _BM25 is None:
+            return []
+        if filtered:
+            # 허용된 문서의 posting 만 채점 (전체 코퍼스 채점 후 거르지 않음)
+            matched, sub = _bm25_scores_allowed(_tokenize(query), allowed)
+            n_pos = int((sub > 0).sum())
+            if n_pos < topk:
+                # 양수 점수 문서가 topk 미만이면 비필터 경로처럼 점수 0 인 허용 문서도 후보에 넣음
+                # (작은 코퍼스에선 음수 점수가 나올 수 있어 함께 정렬)
+                rest = allowed[~np.isin(allowed, matched)][:topk - n_pos]
+                matched, sub = np.concatenate([matched, rest]), np.concatenate([sub, np.zeros(len(rest))])
+            top = np.argsort(sub)[::-1][:topk]
+            order, top_scores = matched[top], sub[top]
+        else:
+            scores = _BM25.get_scores(_tokenize(query))
+            order = np.argsort(scores)[::-1][:topk]
+            top_scores = scores[order]
         out = []
-        for idx in order:
+        for idx, score in zip(order, top_scores):
             r = _BM25_META[idx]
             doc = f"[type={r.get('type','')}] file={r.get('source_file','')}\n{r.get('explanation','')}"
             out.append({
-                "id": f"row-{idx}",
+                "id": f"row-{r['row_idx']}",
                 "row_idx": r["row_idx"],
                 "document": doc,  # explanation 중심
                 "metadata": {
@@ -90,7 +246,7 @@ def retrieve(query: str, topk: int = DENSE_TOPK, mode: str = "dense"):
                     "type": r.get("type",""),
                     "score_meta": float(r.get("score", 0.0)),
                 },
-                "score": float(scores[idx]),
+                "score": float(score),
                 "mode": "bm25"
             })
         return out
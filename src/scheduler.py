@@ -0,0 +1,159 @@
+# scheduler.py
+import heapq, re, sys, time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, List, Dict, Tuple
+
+# ---------- 재시도 사다리 ----------
+def parse_ladder(spec: str) -> List[Tuple[int, int]]:
+    """
+    "2:1,5:1,10:3" → [(k=2, n=1), (5, 1), (10, 3)]
+    시도 a 는 레퍼런스 k 개, 후보 n 개를 사용. 길이 = 케이스당 시도 예산
+    """
+    ladder = []
+    for step in spec.split(","):
+        k, _, n = step.strip().partition(":")
+        ladder.append((int(k), int(n or 1)))
+    if not ladder:
+        raise ValueError("empty ladder")
+    return ladder
+
+# ---------- 스텁 백엔드 (LLM / Isabelle 없이 스케줄러 동작 확인용) ----------
+_PROOF_START_RE = re.compile(r"^\s*(by\b|apply\b|proof\b|unfolding\b|using\b|including\b|supply\b)", re.M)
+
+def _snippet_proof(snippet: str) -> str:
+    m = _PROOF_START_RE.search(snippet or "")
+    return snippet[m.start():].strip() if m else ""
+
+def stub_generate(case: Dict, examples: List[Dict], n: int, tried: set) -> List[str]:
+    # 레퍼런스 snippet 의 증명 부분을 아직 시도하지 않은 것부터 n 개 제안
+    out = []
+    for ex in examples:
+        proof = _snippet_proof(ex.get("snippet", ""))
+        if proof and proof not in tried and proof not in out:
+            out.append(proof)
+        if len(out) >= n:
+            break
+    return out
+
+def _normalize_proof(s: str) -> str:
+    return " ".join((s or "").split())
+
+def stub_verify(case: Dict, proof: str) -> Tuple[bool, Dict]:
+    # gt 와 공백 정규화 후 일치하면 성공
+    return _normalize_proof(proof) == _normalize_proof(case.get("gt")), {"verifier": "stub"}
+
+# ---------- 폐루프 스케줄러 ----------
+def run_closed_loop(cases: List[Dict], retrieve_fn: Callable, to_examples: Callable, generate_fn: Callable,
+                    verify_fn: Callable, ladder: List[Tuple[int, int]],
+                    gen_workers: int = 2, verify_workers: int = 1, log=sys.stderr):
+    """
+    cases: [{"case", "input", "gt"}]
+    retrieve_fn(input) → hits (사다리 최대 k 개, 케이스당 1회만 검색해 시도별로 앞에서 잘라 씀)
+    to_examples(hits) → 프롬프트용 레퍼런스
+    generate_fn(case, examples, n, tried) → 후보 증명 목록
+    verify_fn(case, proof) → (success, detail)
+
+    생성 결과는 바로 검증 큐로 넘어가고, 실패한 케이스만 다음 사다리 단계로 재투입.
+    우선순위 = (시도 번호, 순번) → 모든 케이스의 싼 첫 시도가 재시도보다 먼저 처리됨
+    """
+    heap, seq = [], 0
+    states = {}
+    for c in cases:
+        states[c["case"]] = {"case": c["case"], "input": c["input"], "gt": c.get("gt"),
+                             "solved": False, "proof": None, "attempts": []}
+        heapq.heappush(heap, (0, seq, c))
+        seq += 1
+    hits_cache, tried = {}, {c["case"]: set() for c in cases}
+
+    def _gen(c, attempt):
+        k, n = ladder[attempt]
+        t = time.time()
+        if c["case"] not in hits_cache:
+            hits_cache[c["case"]] = retrieve_fn(c["input"])
+        examples = to_examples(hits_cache[c["case"]][:k])
+        cands = [p for p in generate_fn(c, examples, n, tried[c["case"]]) if p and p not in tried[c["case"]]]
+        return cands, time.time() - t
+
+    def _verify(c, cands):
+        t = time.time()
+        details = []
+        for proof in dict.fromkeys(cands):
+            tried[c["case"]].add(proof)
+            ok, detail = verify_fn(c, proof)
+            details.append(detail)
+            if ok:
+                return proof, details, time.time() - t
+        return None, details, time.time() - t
+
+    gen_pool = ThreadPoolExecutor(max_workers=gen_workers)
+    ver_pool = ThreadPoolExecutor(max_workers=verify_workers)
+    pending = {}
+    t0 = time.time()
+    gen_s = ver_s = 0.0
+    try:
+        while heap or pending:
+            n_gen = sum(1 for kind, _ in pending.values() if kind == "gen")
+            while heap and n_gen < gen_workers:
+                attempt, _, c = heapq.heappop(heap)
+                pending[gen_pool.submit(_gen, c, attempt)] = ("gen", (c, attempt))
+                n_gen += 1
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for fut in done:
+                kind, (c, attempt, *rest) = pending.pop(fut)
+                st = states[c["case"]]
+                if kind == "gen":
+                    gen_err = None
+                    try:
+                        cands, g = fut.result()
+                    except Exception as e:
+                        cands, g, gen_err = [], 0.0, f"{type(e).__name__}: {e}"
+                    gen_s += g
+                    pending[ver_pool.submit(_verify, c, cands)] = ("verify", (c, attempt, len(cands), g, gen_err))
+                    continue
+
+                n_cands, g, gen_err = rest
+                try:
+                    proof, details, v = fut.result()
+                except Exception as e:
+                    proof, details, v = None, [{"error": f"{type(e).__name__}: {e}"}], 0.0
+                ver_s += v
+                k, n = ladder[attempt]
+                st["attempts"].append({
+                    "attempt": attempt, "k": k, "candidates": n_cands, "success": proof is not None,
+                    "gen_s": round(g, 3), "verify_s": round(v, 3), "details": details,
+                })
+                if gen_err:
+                    st["attempts"][-1]["error"] = gen_err
+                print(f"[scheduler] case={c['case']} attempt={attempt} k={k} cands={n_cands} "
+                      f"{'ok' if proof is not None else 'gen_error' if gen_err else 'fail'}", file=log)
+                if proof is not None:
+                    st["solved"], st["proof"] = True, proof
+                elif attempt + 1 < len(ladder):
+                    heapq.heappush(heap, (attempt + 1, seq, c))
+                    seq += 1
+    finally:
+        gen_pool.shutdown(wait=False)
+        ver_pool.shutdown(wait=False)
+
+    wall = time.time() - t0
+    results = [states[c["case"]] for c in cases]
+    solved = sum(1 for r in results if r["solved"])
+    by_attempt = {}
+    for r in results:
+        if r["solved"]:
+            a = r["attempts"][-1]["attempt"]
+            by_attempt[a] = by_attempt.get(a, 0) + 1
+    report = {
+        "lemmas": len(results),
+        "solved": solved,
+        "solved_by_attempt": {str(a): c for a, c in sorted(by_attempt.items())},
+        "attempts": sum(len(r["attempts"]) for r in results),
+        "wall_s": round(wall, 3),
+        "gen_s": round(gen_s, 3),
+        "verify_s": round(ver_s, 3),
+        "solved_per_hour": round(solved / wall * 3600, 1) if wall > 0 else None,
+    }
+    print(f"[scheduler] solved={solved}/{len(results)} attempts={report['attempts']} "
+          f"by_attempt={report['solved_by_attempt']} wall={wall:.1f}s gen={gen_s:.1f}s verify={ver_s:.1f}s "
+          f"solved/hour={report['solved_per_hour']}", file=log)
+    return results, report
@@ -1,35 +1,33 @@
-import json
-import numpy as np
-from rank_bm25 import BM25Okapi
-from src.config import JSONL_PATH
 from src.retrieval import retrieve
 
-# ---- Sparse(BM25) 코퍼스 로드 (프로세스 최초 1회) ----
-_bm25_tokens, _bm25_meta = [], []
+def _hit_to_record(h):
+    # retrieve() hit(dense/bm25 공통: document = "[type=..] file=..\n{explanation}") → 레코드 필드
+    meta = h.get("metadata") or {}
+    doc = h.get("document", "")
+    return {
+        "row_idx": int(h["row_idx"]),
+        "explanation": doc.split("\n", 1)[1] if "\n" in doc else doc,
+        "snippet": meta.get("snippet",""),
+        "source_file": meta.get("source_file",""),
+        "type": meta.get("type",""),
+        "score": float(meta.get("score", meta.get("score_meta", 0.0))),
+    }
 
-with open(JSONL_PATH, "r", encoding="utf-8") as f:
-    for line in f:
-        if not line.strip():
-            continue
-        rec = json.loads(line)
-        text = f"{rec.get('explanation','')} {rec.get('snippet','')} {rec.get('source_file','')}"
-        _bm25_tokens.append(text.split())
-        _bm25_meta.append(rec)
-        
-_bm25 = BM25Okapi(_bm25_tokens)
+def search_hybrid(query: str, k_dense=50, k_sparse=50, rrf_c=60, final_n=10,
+                  path_prefix=None, types=None, exclude_file=None):
+    """
+    path_prefix / types / exclude_file: source_file 접두사, type 집합, 제외할 source_file (사전 필터)
+    dense/sparse 모두 retrieve() 경유 → 샤드 모드(retrieval.use_shards)에서도 그대로 scatter-gather
+    """
+    filters = dict(path_prefix=path_prefix, types=types, exclude_file=exclude_file)
 
-def _sparse_rank(query: str, k: int):
-    scores = _bm25.get_scores(query.split())
-    order = np.argsort(scores)[::-1][:k]
-    return {int(idx): rank for rank, idx in enumerate(order)}
-
-def search_hybrid(query: str, k_dense=50, k_sparse=50, rrf_c=60, final_n=10):
     # 1) Dense 후보
-    dense_hits = retrieve(query, topk=k_dense, mode='dense')
+    dense_hits = retrieve(query, topk=k_dense, mode='dense', **filters)
     dense_by_row = {int(h["row_idx"]): rank for rank, h in enumerate(dense_hits) if h["row_idx"] is not None}
 
     # 2) Sparse 후보 (row_idx = JSONL의 행번호)
-    sparse_rank = _sparse_rank(query, k=k_sparse)
+    sparse_hits = retrieve(query, topk=k_sparse, mode='bm25', **filters)
+    sparse_rank = {int(h["row_idx"]): rank for rank, h in enumerate(sparse_hits)}
 
     # 3) RRF 결합
     cand_rows = set(dense_by_row) | set(sparse_rank)
@@ -42,15 +40,7 @@ def search_hybrid(query: str, k_dense=50, k_sparse=50, rrf_c=60, final_n=10):
     scored.sort(reverse=True)
 
     # 4) 최종 N개 반환 (explanation/snippet/source_file 포함)
-    results = []
-    for _, row in scored[:final_n]:
-        rec = _bm25_meta[row]
-        results.append({
-            "row_idx": row,
-            "explanation": rec.get("explanation",""),
-            "snippet": rec.get("snippet",""),
-            "source_file": rec.get("source_file",""),
-            "type": rec.get("type",""),
-            "score": float(rec.get("score", 0.0)),
-        })
-    return results
+    hit_by_row = {int(h["row_idx"]): h for h in dense_hits if h["row_idx"] is not None}
+    hit_by_row.update({int(h["row_idx"]): h for h in sparse_hits})
+    # score = 코퍼스 레코드의 메타 점수, rrf_score = 이번 검색의 RRF 점수
+    return [dict(_hit_to_record(hit_by_row[row]), rrf_score=s) for s, row in scored[:final_n]]
@@ -0,0 +1,105 @@
+# shards.py
+import math, threading
+import multiprocessing as mp
+from src.config import JSONL_PATH
+
+# BM25Okapi 기본값과 동일해야 단일 인덱스 점수와 일치
+BM25_EPSILON = 0.25
+
+def global_idf(df: dict, n: int, epsilon: float = BM25_EPSILON) -> dict:
+    # rank_bm25.BM25Okapi._calc_idf 와 같은 식 (음수 idf 는 epsilon * 평균 idf 로 대체)
+    idf, negative = {}, []
+    for tok, freq in df.items():
+        v = math.log(n - freq + 0.5) - math.log(freq + 0.5)
+        idf[tok] = v
+        if v < 0:
+            negative.append(tok)
+    eps = epsilon * (sum(idf.values()) / len(idf)) if idf else 0.0
+    for tok in negative:
+        idf[tok] = eps
+    return idf
+
+def _worker(conn, shard, num_shards, jsonl_path):
+    # 샤드 하나의 dense(Chroma 샤드 컬렉션) + sparse(BM25) 인덱스를 들고 요청 처리
+    from src import retrieval
+    retrieval.configure(jsonl_path=jsonl_path, shard=(shard, num_shards))
+    ops = {
+        "retrieve": retrieval.retrieve,
+        "bm25_stats": retrieval.bm25_stats,
+        "set_bm25_stats": retrieval.set_bm25_global_stats,
+    }
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        op, kwargs = msg
+        try:
+            conn.send(("ok", ops[op](**kwargs)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+    conn.close()
+
+class ShardPool:
+    """
+    샤드별 워커 프로세스에 질의를 scatter 하고 결과를 gather 해 전역 top-k 로 병합
+    - dense: 샤드별 top-k 를 score 로 병합 (샤드 내 top-k 의 합집합에 전역 top-k 가 반드시 포함)
+    - bm25: 최초 1회 샤드 통계(df, 문서 수, 총 길이)를 모아 전역 idf/avgdl 을 워커에 배포한 뒤 동일하게 병합
+    """
+    def __init__(self, num_shards: int, jsonl_path: str = JSONL_PATH):
+        ctx = mp.get_context("spawn")
+        self.num_shards = num_shards
+        self.conns, self.procs = [], []
+        for i in range(num_shards):
+            parent, child = ctx.Pipe()
+            p = ctx.Process(target=_worker, args=(child, i, num_shards, jsonl_path), daemon=True)
+            p.start()
+            self.conns.append(parent)
+            self.procs.append(p)
+        self._bm25_ready = False
+        self._lock = threading.Lock()  # 추측 검색 스레드 등 동시 호출 시 파이프 응답이 섞이지 않게
+
+    def _scatter(self, op: str, **kwargs):
+        with self._lock:
+            return self._scatter_locked(op, **kwargs)
+
+    def _scatter_locked(self, op: str, **kwargs):
+        for c in self.conns:
+            c.send((op, kwargs))
+        outs = []
+        for i, c in enumerate(self.conns):
+            status, out = c.recv()
+            if status != "ok":
+                raise RuntimeError(f"shard {i}/{self.num_shards} {op} failed: {out}")
+            outs.append(out)
+        return outs
+
+    def _ensure_global_bm25(self):
+        if self._bm25_ready:
+            return
+        stats = self._scatter("bm25_stats")
+        n = sum(s["n"] for s in stats)
+        total_len = sum(s["total_len"] for s in stats)
+        df = {}
+        for s in stats:
+            for tok, c in s["df"].items():
+                df[tok] = df.get(tok, 0) + c
+        self._scatter("set_bm25_stats", idf=global_idf(df, n), avgdl=(total_len / n) if n else 0.0)
+        self._bm25_ready = True
+
+    def retrieve(self, query: str, topk: int, mode: str = "dense", **filters):
+        if mode == "bm25":
+            self._ensure_global_bm25()
+        outs = self._scatter("retrieve", query=query, topk=topk, mode=mode, **filters)
+        hits = [h for out in outs for h in out]
+        hits.sort(key=lambda h: h["score"], reverse=True)
+        return hits[:topk]
+
+    def close(self):
+        for c in self.conns:
+            try:
+                c.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for p in self.procs:
+            p.join(timeout=5)
+        self.conns, self.procs = [], []
@@ -0,0 +1,82 @@
+# speculative.py
+import sys, time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, List, Dict
+
+# 추측 검색(dense, bm25)은 LLM 호출과 풀을 나눠, 늦은 설명 호출이 검색을 막지 못하게 함
+_RETRIEVAL_POOL = ThreadPoolExecutor(max_workers=2)
+# 설명 호출은 deadline 을 요청 타임아웃으로 받아 늦어도 deadline 무렵 끝나므로 동시에 남는 호출은 소수
+_EXPLAIN_POOL = ThreadPoolExecutor(max_workers=2)
+
+def rrf_merge(hit_lists: List[List[Dict]], topk: int, rrf_c: int = 60) -> List[Dict]:
+    # row_idx 기준 RRF 결합, 앞선 리스트의 hit 을 대표로 사용 (score 는 RRF 값이므로 mode="speculative")
+    scored, first = {}, {}
+    for hits in hit_lists:
+        for rank, h in enumerate(hits):
+            key = h["row_idx"] if h.get("row_idx") is not None else h.get("id")
+            scored[key] = scored.get(key, 0.0) + 1.0 / (rank + 1 + rrf_c)
+            first.setdefault(key, h)
+    order = sorted(scored, key=lambda k: scored[k], reverse=True)[:topk]
+    return [dict(first[k], score=scored[k], mode="speculative") for k in order]
+
+def speculative_retrieve(query: str, explain: Callable, retrieve: Callable, topk: int,
+                         mode: str = "dense", deadline: float = 10.0, **filters):
+    """
+    설명 호출이 도는 동안 원문 lemma 로 dense/bm25 검색을 먼저 수행
+    - deadline(초, 케이스 시작 기준) 안에 설명이 오면 설명 검색 결과와 RRF 병합 → "merged"
+    - 늦으면 "timeout", 실패(예외 또는 설명 추출 실패)면 "failed" → 추측 결과만 사용
+    - 추측 검색 중 일부가 실패하면 그 결과만 빼고 진행 → 경로에 "_partial" 을 붙임
+    - 추측 검색이 모두 실패하면 직렬 경로(설명 또는 원문으로 mode 검색 1회)로 대체 → "spec_failed"
+    explain(text, timeout): timeout=deadline 으로 LLM 요청 자체를 끊어 버려질 호출이 계속 남지 않게 함
+    반환: (explanation, hits, path, latency_s)
+    """
+    t0 = time.time()
+    exp_f = _EXPLAIN_POOL.submit(explain, query, deadline)
+    spec_fs = {m: _RETRIEVAL_POOL.submit(retrieve, query, topk=topk, mode=m, **filters) for m in ("dense", "bm25")}
+    spec = []
+    for m, f in spec_fs.items():
+        try:
+            spec.append(f.result())
+        except Exception as e:
+            print(f"[WARN] speculative {m} retrieval failed: {type(e).__name__}: {e}", file=sys.stderr)
+
+    explanation, path = None, "failed"
+    try:
+        explanation = exp_f.result(timeout=max(0.0, deadline - (time.time() - t0)))
+    except FutureTimeout:
+        exp_f.cancel()  # 아직 시작 전(앞선 호출 대기 중)이면 서버에 보내지도 않음
+        path = "timeout"
+    except Exception:
+        pass
+    has_exp = bool(explanation) and explanation != query
+
+    if not spec:
+        hits = retrieve(explanation if has_exp else query, topk=topk, mode=mode, **filters)
+        return explanation or query, hits, "spec_failed", time.time() - t0
+    if has_exp:
+        hits = rrf_merge([retrieve(explanation, topk=topk, mode=mode, **filters)] + spec, topk)
+        path = "merged"
+    else:
+        hits = rrf_merge(spec, topk)
+    if len(spec) < len(spec_fs):
+        path += "_partial"
+    return explanation or query, hits, path, time.time() - t0
+
+class SpeculativeStats:
+    # 경로별(serial / merged / timeout / failed, *_partial / spec_failed) 케이스 수와 케이스당 end-to-end 검색 지연
+    def __init__(self):
+        self.paths = {}
+        self.latencies = []
+
+    def add(self, path: str, latency: float):
+        self.paths[path] = self.paths.get(path, 0) + 1
+        self.latencies.append(latency)
+
+    def report(self, file=sys.stderr):
+        if not self.latencies:
+            return
+        lat = sorted(self.latencies)
+        n = len(lat)
+        paths = " ".join(f"{p}={c}" for p, c in sorted(self.paths.items()))
+        print(f"[retrieval] cases={n} {paths} latency mean={sum(lat)/n:.2f}s "
+              f"p50={lat[n // 2]:.2f}s max={lat[-1]:.2f}s", file=file)
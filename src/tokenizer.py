@@ -0,0 +1,118 @@
+# tokenizer.py
+import hashlib, json, os, re
+from typing import List, Dict, Tuple
+import numpy as np
+from src.config import TOKEN_CACHE_DIR
+
+# 토크나이저 규칙이 바뀌면 올려서 캐시 무효화
+TOKENIZER_VERSION = 1
+
+# ---------- Isabelle-aware 토크나이저 ----------
+# \<lbrace>, \<^sub> 같은 심볼 이스케이프 / 식별자 / 숫자 / 연산자 열(==>, -->, ...)
+_TOKEN_RE = re.compile(r"""
+    (?P<sym>\\<\^?[A-Za-z0-9_]+>)
+  | (?P<ident>[A-Za-z][A-Za-z0-9_']*)
+  | (?P<num>\d+)
+  | (?P<op>[=<>\-+*/|&~!:@%^]{2,}|[=<>+*/|&~!:@%^])
+""", re.X)
+_CAMEL_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+def _split_ident(ident: str) -> List[str]:
+    # corres_underlyingK_def → corres, underlying, k, def
+    parts = []
+    for piece in re.split(r"[_']", ident):
+        parts.extend(p.lower() for p in _CAMEL_RE.findall(piece))
+    return parts
+
+def tokenize(s: str) -> List[str]:
+    """
+    괄호/쉼표 등 구두점은 버리고, 식별자는 원형 + underscore/camel 분해 조각을 함께 냄
+    "(simp add: corres_underlyingK_def)+" → simp, add, :, corres_underlyingK_def, corres, underlying, k, def, +
+    """
+    out = []
+    for m in _TOKEN_RE.finditer(s):
+        kind, tok = m.lastgroup, m.group()
+        out.append(tok)
+        if kind == "ident":
+            parts = _split_ident(tok)
+            if len(parts) > 1 or (len(tok) > 1 and parts and parts[0] != tok):
+                out.extend(parts)
+    return out
+
+def bm25_text(rec: Dict) -> str:
+    return f"{rec.get('explanation','')} {rec.get('snippet','')} {rec.get('source_file','')}"
+
+# ---------- 정수 ID 인턴 ----------
+class Vocab:
+    def __init__(self, tokens: List[str] = None):
+        self.id_to_token = list(tokens or [])
+        self.token_to_id = {t: i for i, t in enumerate(self.id_to_token)}
+
+    def __len__(self):
+        return len(self.id_to_token)
+
+    def intern(self, tokens: List[str]) -> List[int]:
+        ids = []
+        for t in tokens:
+            i = self.token_to_id.get(t)
+            if i is None:
+                i = len(self.id_to_token)
+                self.token_to_id[t] = i
+                self.id_to_token.append(t)
+            ids.append(i)
+        return ids
+
+    def encode(self, tokens: List[str]) -> List[int]:
+        # 질의용: 모르는 토큰은 어차피 BM25 점수 0 → 버림
+        return [self.token_to_id[t] for t in tokens if t in self.token_to_id]
+
+# ---------- 디스크 캐시 ----------
+def _cache_paths(jsonl_path: str, cache_key: str = None) -> Tuple[str, str]:
+    # 같은 파일 이름의 다른 코퍼스끼리 캐시를 덮어쓰지 않도록 절대 경로 해시를 붙임
+    path_hash = hashlib.sha1(os.path.abspath(jsonl_path).encode("utf-8")).hexdigest()[:10]
+    stem = f"{cache_key or os.path.splitext(os.path.basename(jsonl_path))[0]}.{path_hash}"
+    return (os.path.join(TOKEN_CACHE_DIR, f"{stem}.vocab.json"),
+            os.path.join(TOKEN_CACHE_DIR, f"{stem}.tokens.npz"))
+
+def _signature(jsonl_path: str) -> Dict:
+    st = os.stat(jsonl_path)
+    return {"path": os.path.abspath(jsonl_path), "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns, "version": TOKENIZER_VERSION}
+
+def _load_cache(jsonl_path: str, cache_key: str = None):
+    vocab_path, tokens_path = _cache_paths(jsonl_path, cache_key)
+    if not (os.path.exists(vocab_path) and os.path.exists(tokens_path)):
+        return None
+    with open(vocab_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("signature") != _signature(jsonl_path):
+        return None
+    with np.load(tokens_path) as arr:
+        ids, offsets = arr["ids"], arr["offsets"]
+    return Vocab(data["tokens"]), ids, offsets
+
+def _save_cache(jsonl_path: str, vocab: Vocab, ids: np.ndarray, offsets: np.ndarray, cache_key: str = None):
+    vocab_path, tokens_path = _cache_paths(jsonl_path, cache_key)
+    os.makedirs(TOKEN_CACHE_DIR, exist_ok=True)
+    np.savez(tokens_path, ids=ids, offsets=offsets)
+    with open(vocab_path, "w", encoding="utf-8") as f:
+        json.dump({"signature": _signature(jsonl_path), "tokens": vocab.id_to_token}, f, ensure_ascii=False)
+
+def load_tokenized_corpus(jsonl_path: str, records: List[Dict], cache_key: str = None) -> Tuple[List[List[int]], Vocab]:
+    """
+    records(JSONL 순서)의 BM25 토큰 ID 목록과 어휘를 반환
+    캐시(평탄화된 ids + offsets, 어휘 JSON)가 JSONL 과 일치하면 재토큰화 없이 그대로 사용
+    cache_key: 같은 JSONL 의 부분집합(샤드 등)을 따로 캐시할 때의 파일 이름
+    """
+    cached = _load_cache(jsonl_path, cache_key)
+    if cached is not None and len(cached[2]) == len(records) + 1:
+        vocab, ids, offsets = cached
+    else:
+        vocab = Vocab()
+        docs = [vocab.intern(tokenize(bm25_text(rec))) for rec in records]
+        offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(d) for d in docs])
+        ids = np.fromiter((i for d in docs for i in d), dtype=np.int32, count=int(offsets[-1]))
+        _save_cache(jsonl_path, vocab, ids, offsets, cache_key)
+    corpus = [ids[offsets[i]:offsets[i + 1]].tolist() for i in range(len(offsets) - 1)]
+    return corpus, vocab